@@ -4,7 +4,8 @@ import os
 import time
 import random
 import xml.etree.ElementTree as ET
-import math
+from collections import defaultdict
+import numpy as np
 
 # -------------------- SUMO PATH SETUP --------------------
 if 'SUMO_HOME' not in os.environ:
@@ -14,12 +15,13 @@ tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
 if tools not in sys.path:
     sys.path.append(tools)
 
-import traci
+from sumo_backend import traci, USE_GUI
+import traci.constants as tc
 import sumolib
 
 # ----------------------------
 # SUMO setup
-sumoBinary = sumolib.checkBinary("sumo-gui")
+sumoBinary = sumolib.checkBinary("sumo-gui" if USE_GUI else "sumo")
 sumoConfig = "simulation.sumocfg"
 
 # ----------------------------
@@ -31,6 +33,9 @@ root = tree.getroot()
 routes = [r.attrib['id'] for r in root.findall("route")]
 vtypes = {v.attrib['id']: v for v in root.findall("vType")}
 
+ROUTES_TUPLE = tuple(routes)
+NON_AMBULANCE_TYPES = [v for v in vtypes.keys() if v != "ambulance"]
+
 print("Loaded routes:", routes)
 print("Loaded vehicle types:", list(vtypes.keys()))
 
@@ -39,8 +44,12 @@ NUM_INITIAL_VEHICLES = 8
 SPAWN_INTERVAL = 10
 VEHICLE_COUNTER = 0
 COLLISION_DISTANCE = 2.5  # meters threshold
+SUBSCRIBED_VARS = [tc.VAR_POSITION, tc.VAR_ROAD_ID, tc.VAR_SPEED]
+COLLISION_DIST_SQ = COLLISION_DISTANCE ** 2  # compare squared distances, no sqrt
+CELL_SIZE = COLLISION_DISTANCE  # grid cell size for collision binning
 
 stopped_vehicles = set()
+frozen_vehicles = set()  # stopped vehicles already at rest at the previous step
 reported_collisions = set()
 
 # ----------------------------
@@ -63,6 +72,7 @@ ambulance_parking_routes = {
 for vid, route in ambulance_parking_routes.items():
     # Add vehicle on parking route
     traci.vehicle.add(vid, routeID=route, typeID="ambulance", depart=0)
+    traci.vehicle.subscribe(vid, SUBSCRIBED_VARS)
 
     # Set all emergency and gap parameters to avoid movement
     traci.vehicle.setSpeed(vid, 0)
@@ -84,9 +94,10 @@ def spawn_vehicle(step):
     vid = f"veh{VEHICLE_COUNTER}"
     VEHICLE_COUNTER += 1
 
-    r = random.choice(routes)
-    t = random.choice([v for v in vtypes.keys() if v != "ambulance"])
+    r = random.choice(ROUTES_TUPLE)
+    t = random.choice(NON_AMBULANCE_TYPES)
     traci.vehicle.add(vid, routeID=r, typeID=t, depart=step)
+    traci.vehicle.subscribe(vid, SUBSCRIBED_VARS)
     traci.vehicle.setEmergencyDecel(vid, 1000)
     traci.vehicle.setTau(vid, 0)
     traci.vehicle.setMinGap(vid, 0)
@@ -98,6 +109,40 @@ def spawn_vehicle(step):
 
     print(f"Spawned {vid} on {r} as {t} at speed {speed:.1f} m/s at step {step}")
 
+# ----------------------------
+# Uniform-grid broad phase: with cells of COLLISION_DISTANCE, a vehicle can
+# only collide with vehicles in its own cell or one of the 8 around it.
+# Only moving vehicles start a scan; frozen ones are still in the grid so
+# a moving vehicle running into them is caught, but two frozen vehicles
+# (whose distance cannot have changed since it was last checked) are not
+# compared again. Candidate pairs are then tested in one vectorized pass
+# over the xs/ys coordinate arrays.
+def find_close_pairs(xs, ys, moving):
+    cx = np.floor(xs / CELL_SIZE).astype(np.int64).tolist()
+    cy = np.floor(ys / CELL_SIZE).astype(np.int64).tolist()
+    grid = defaultdict(list)
+    for i, cell in enumerate(zip(cx, cy)):
+        grid[cell].append(i)
+
+    is_moving = moving.tolist()
+    cand_i, cand_j = [], []
+    for i in np.flatnonzero(moving).tolist():
+        for nx in (cx[i] - 1, cx[i], cx[i] + 1):
+            for ny in (cy[i] - 1, cy[i], cy[i] + 1):
+                for j in grid.get((nx, ny), ()):
+                    # moving/moving pairs are seen from both ends; keep one
+                    if j == i or (j < i and is_moving[j]):
+                        continue
+                    cand_i.append(i)
+                    cand_j.append(j)
+
+    cand_i = np.array(cand_i, dtype=np.intp)
+    cand_j = np.array(cand_j, dtype=np.intp)
+    dx = xs[cand_i] - xs[cand_j]
+    dy = ys[cand_i] - ys[cand_j]
+    hit = dx * dx + dy * dy < COLLISION_DIST_SQ
+    return cand_i[hit], cand_j[hit]
+
 # ----------------------------
 # Spawn initial vehicles
 for _ in range(NUM_INITIAL_VEHICLES):
@@ -110,36 +155,50 @@ MAX_STEPS = 500  # or infinite loop if desired
 while step < MAX_STEPS:
     traci.simulationStep()
     step += 1
-    time.sleep(0.5)
+    if USE_GUI:
+        time.sleep(0.5)  # pace the GUI only; headless runs go as fast as they can
 
     # Spawn new vehicles periodically
     if step % SPAWN_INTERVAL == 0:
         for _ in range(random.randint(1, 2)):
             spawn_vehicle(step)
 
-    # Get positions of all vehicles
-    vehicles = traci.vehicle.getIDList()
-    positions = {vid: traci.vehicle.getPosition(vid) for vid in vehicles}
+    # Get positions of all vehicles in a single subscription fetch, laid out
+    # as parallel id / x / y arrays (vehicles still waiting for insertion
+    # have no road yet and are skipped)
+    subs = traci.vehicle.getAllSubscriptionResults()
+    ids = [vid for vid, res in subs.items() if res[tc.VAR_ROAD_ID]]
+    xs = np.fromiter((subs[vid][tc.VAR_POSITION][0] for vid in ids), dtype=np.float32, count=len(ids))
+    ys = np.fromiter((subs[vid][tc.VAR_POSITION][1] for vid in ids), dtype=np.float32, count=len(ids))
+    moving = np.fromiter((vid not in frozen_vehicles for vid in ids), dtype=bool, count=len(ids))
+
+    # Forget vehicles that have left the simulation
+    stopped_vehicles.intersection_update(subs)
+    reported_collisions = {p for p in reported_collisions if p[0] in subs and p[1] in subs}
 
     # Check collisions
-    for vid1, pos1 in positions.items():
-        for vid2, pos2 in positions.items():
-            if vid1 >= vid2:
-                continue
-            distance = math.hypot(pos1[0] - pos2[0], pos1[1] - pos2[1])
-            pair = tuple(sorted([vid1, vid2]))
-            if distance < COLLISION_DISTANCE and pair not in reported_collisions:
-                # Stop involved vehicles permanently
-                for v in pair:
-                    traci.vehicle.setSpeed(v, 0)
-                    stopped_vehicles.add(v)
-
-                x, y = pos1
-                sim_time = traci.simulation.getTime()
-                print(f"⚠️ Accident detected between {vid1} and {vid2} "
-                      f"at location=({x:.2f}, {y:.2f}), time={sim_time:.1f}s")
-
-                reported_collisions.add(pair)
+    for i, j in zip(*find_close_pairs(xs, ys, moving)):
+        if ids[i] > ids[j]:
+            i, j = j, i
+        vid1, vid2 = ids[i], ids[j]
+        pair = (vid1, vid2)  # already ordered by the swap above
+        if pair in reported_collisions:
+            continue
+
+        # Stop involved vehicles permanently
+        for v in pair:
+            traci.vehicle.setSpeed(v, 0)
+            stopped_vehicles.add(v)
+
+        x, y = xs[i], ys[i]
+        sim_time = traci.simulation.getTime()
+        print(f"⚠️ Accident detected between {vid1} and {vid2} "
+              f"at location=({x:.2f}, {y:.2f}), time={sim_time:.1f}s")
+
+        reported_collisions.add(pair)
+
+    # Stopped vehicles that have come to rest will not move again
+    frozen_vehicles = {vid for vid in ids if vid in stopped_vehicles and subs[vid][tc.VAR_SPEED] == 0}
 
 # ----------------------------
 traci.close()
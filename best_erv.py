@@ -1,9 +1,11 @@
-import random
 import math
-import traci
+import numpy as np
+from sumo_backend import traci
+import traci.constants as tc
 from congestion import get_fuzzy_congestion
 
 # -------------------- GA Parameters --------------------
+USE_GA = False  # False: pick the best ambulance by exhaustive evaluation
 POP_SIZE = 20
 GENERATIONS = 30
 TOURNAMENT_K = 3
@@ -17,6 +19,8 @@ ambulance_readiness = {
     "ambulance2": 90
 }
 
+AMBULANCES = np.array(list(ambulance_readiness.keys()))
+
 ambulance_routes = {
     "ambulance0": "routeAmbulance0",  # A_B_parking
     "ambulance1": "routeAmbulance1",  # D_G_parking
@@ -32,26 +36,37 @@ ambulance_anchor_edges = {
 # =======================================================
 # FITNESS FUNCTION
 # =======================================================
-def fitness(individual, accident_x, accident_y, positions, accident_edge=None):
+def get_congestion(individual, edge_ids=None):
+    """Fuzzy congestion (0-10) on the ambulance's current edge, 5.0 if unknown"""
+    if edge_ids is not None:
+        edge_id = edge_ids[individual]
+    else:
+        try:
+            edge_id = traci.vehicle.getRoadID(individual)
+        except traci.TraCIException:
+            return 5.0
+    return get_fuzzy_congestion(edge_id)
+
+def _fitness_numeric(x, y, accident_x, accident_y, readiness, congestion_val, edge_bonus):
+    dist = math.sqrt((x - accident_x) ** 2 + (y - accident_y) ** 2)
+
+    # Normalize
+    readiness_norm = readiness / 100.0
+    distance_penalty = dist / 200.0
+    congestion_penalty = congestion_val / 10.0
+
+    return readiness_norm - distance_penalty - congestion_penalty + edge_bonus
+
+def fitness(individual, accident_x, accident_y, positions, accident_edge=None, edge_ids=None):
     """Fitness = readiness - distance penalty - congestion penalty + edge bonus"""
     if individual not in positions:
         return -9999.0
 
     (x, y) = positions[individual]
-    dist = math.sqrt((x - accident_x) ** 2 + (y - accident_y) ** 2)
     readiness = ambulance_readiness.get(individual, 50)
 
     # --- Congestion penalty ---
-    try:
-        edge_id = traci.vehicle.getRoadID(individual)
-        congestion_val = get_fuzzy_congestion(edge_id)
-    except Exception:
-        congestion_val = 5.0
-
-    # Normalize
-    readiness_norm = readiness / 100.0
-    distance_penalty = dist / 200.0
-    congestion_penalty = congestion_val / 10.0
+    congestion_val = get_congestion(individual, edge_ids)
 
     # --- Accident edge bonus ---
     edge_bonus = 0.0
@@ -62,51 +77,52 @@ def fitness(individual, accident_x, accident_y, positions, accident_edge=None):
         elif (anchor_edge[0] == accident_edge[0]) or (anchor_edge[-1] == accident_edge[-1]):
             edge_bonus = 0.5
 
-    score = readiness_norm - distance_penalty - congestion_penalty + edge_bonus
-    return score
+    return _fitness_numeric(x, y, accident_x, accident_y, readiness, congestion_val, edge_bonus)
 
 # =======================================================
 # SELECTION / CROSSOVER / MUTATION
 # =======================================================
-def tournament_selection(pop, fitnesses):
-    best = random.choice(pop)
-    for _ in range(TOURNAMENT_K - 1):
-        challenger = random.choice(pop)
-        if fitnesses[challenger] > fitnesses[best]:
-            best = challenger
-    return best
-
-def crossover(parent1, parent2):
-    if random.random() < CROSSOVER_RATE:
-        return random.choice([parent1, parent2])
-    return parent1
-
-def mutate(individual):
-    if random.random() < MUTATION_RATE:
-        return random.choice(list(ambulance_readiness.keys()))
-    return individual
+# The population is an int8 array of indices into AMBULANCES, and fitness
+# is looked up by index in a matching float32 array. Each operator works on
+# a whole generation at once.
+def tournament_selection(pop, fit_arr, n):
+    """Winners of n independent TOURNAMENT_K-way tournaments"""
+    cand = np.random.randint(0, len(pop), (n, TOURNAMENT_K))
+    return pop[cand[np.arange(n), fit_arr[pop[cand]].argmax(1)]]
+
+def crossover(parents1, parents2):
+    take_second = ((np.random.random(len(parents1)) < CROSSOVER_RATE)
+                   & (np.random.random(len(parents1)) < 0.5))
+    return np.where(take_second, parents2, parents1)
+
+def mutate(children):
+    mutated = np.random.random(len(children)) < MUTATION_RATE
+    return np.where(mutated, np.random.randint(0, len(AMBULANCES), len(children)), children)
 
 # =======================================================
 # GA DRIVER
 # =======================================================
-def select_best_ambulance(accident_x, accident_y, positions, accident_edge):
-    population = [random.choice(list(ambulance_readiness.keys())) for _ in range(POP_SIZE)]
+def run_ga(fit_cache):
+    fit_arr = np.array([fit_cache[amb] for amb in AMBULANCES], dtype=np.float32)
+    population = np.random.randint(0, len(AMBULANCES), POP_SIZE, dtype=np.int8)
 
     for _ in range(GENERATIONS):
-        fitnesses = {ind: fitness(ind, accident_x, accident_y, positions, accident_edge)
-                     for ind in population}
-        new_population = []
-        while len(new_population) < POP_SIZE:
-            p1 = tournament_selection(population, fitnesses)
-            p2 = tournament_selection(population, fitnesses)
-            child = crossover(p1, p2)
-            child = mutate(child)
-            new_population.append(child)
-        population = new_population
-
-    final_fitnesses = {ind: fitness(ind, accident_x, accident_y, positions, accident_edge)
-                       for ind in population}
-    best = max(final_fitnesses, key=final_fitnesses.get)
+        winners = tournament_selection(population, fit_arr, 2 * POP_SIZE)
+        children = crossover(winners[:POP_SIZE], winners[POP_SIZE:])
+        population = mutate(children).astype(np.int8)
+
+    return str(AMBULANCES[population[np.argmax(fit_arr[population])]])
+
+def select_best_ambulance(accident_x, accident_y, positions, accident_edge, edge_ids=None):
+    # The gene pool is just the ambulances, so score each of them once
+    fit_cache = {amb: fitness(amb, accident_x, accident_y, positions, accident_edge, edge_ids)
+                 for amb in ambulance_readiness}
+
+    # With only three candidates the argmax is exact; the GA is kept for experiments
+    if USE_GA:
+        best = run_ga(fit_cache)
+    else:
+        best = max(fit_cache, key=fit_cache.get)
     print(f"Selected Best Ambulance: {best} (Route: {ambulance_routes[best]})")
     return best
 
@@ -129,21 +145,30 @@ def detect_accident(veh1, veh2, accident_x, accident_y):
 def handle_accident(veh1, veh2, accident_x, accident_y):
     accident_edge = detect_accident(veh1, veh2, accident_x, accident_y)
 
-    # Collect ambulance positions
+    # Collect ambulance positions and edges (from subscriptions when the
+    # caller has set them up, otherwise one query per ambulance)
+    subs = traci.vehicle.getAllSubscriptionResults()
     positions = {}
+    edge_ids = {}
     for amb in ambulance_readiness.keys():
+        res = subs.get(amb, {})
+        if tc.VAR_POSITION in res and tc.VAR_ROAD_ID in res:
+            positions[amb] = res[tc.VAR_POSITION]
+            edge_ids[amb] = res[tc.VAR_ROAD_ID]
+            continue
         try:
-            pos = traci.vehicle.getPosition(amb)
-            positions[amb] = pos
+            positions[amb] = traci.vehicle.getPosition(amb)
+            edge_ids[amb] = traci.vehicle.getRoadID(amb)
         except Exception:
             continue
 
     # GA Selection
-    best_ambulance = select_best_ambulance(accident_x, accident_y, positions, accident_edge)
+    best_ambulance = select_best_ambulance(accident_x, accident_y, positions, accident_edge, edge_ids)
 
-    # Deploy ambulance
+    # Deploy ambulance (ambulances in the simulation are exactly those with
+    # a position above, so no ID-list round-trip is needed)
     try:
-        if best_ambulance not in traci.vehicle.getIDList():
+        if best_ambulance not in positions:
             traci.vehicle.add(best_ambulance,
                               routeID=ambulance_routes[best_ambulance],
                               typeID="ambulance")
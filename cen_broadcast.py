@@ -1,13 +1,24 @@
 import time
-import traci
 import math
+from collections import OrderedDict
+import numpy as np
+from sumo_backend import traci
+import traci.constants as tc
 
 class CENBroadcast:
-    def __init__(self, interval=5, edge_nodes=None):
+    def __init__(self, interval=5, edge_nodes=None, max_age=300):
         self.interval = interval
-        self.accidents = {}
+        self.max_age = max_age  # seconds an accident stays on the air after registration
+        self.accidents = OrderedDict()  # oldest registration first
         self.edge_nodes = edge_nodes if edge_nodes else {}
 
+        # Edge nodes are fixed infrastructure: keep their positions as an (E, 2)
+        # array, plus the id -> position map handed to listening vehicles
+        self._edge_ids = list(self.edge_nodes)
+        self._edge_positions = {k: v['position'] for k, v in self.edge_nodes.items()}
+        self._edge_xy = np.array([info['position'] for info in self.edge_nodes.values()],
+                                 dtype=np.float32).reshape(-1, 2)
+
         self.edgecen_names = {
             "EdgeNode_A": "EdgeCEN_A",
             "EdgeNode_D": "EdgeCEN_D",
@@ -16,16 +27,10 @@ class CENBroadcast:
         }
 
     def get_nearest_edge_node(self, position):
-        x, y = position
-        min_dist = float('inf')
-        nearest_edge = None
-        for edge_id, info in self.edge_nodes.items():
-            node_x, node_y = info['position']
-            dist = math.hypot(x - node_x, y - node_y)
-            if dist < min_dist:
-                min_dist = dist
-                nearest_edge = edge_id
-        return nearest_edge
+        if not self._edge_ids:
+            return None
+        d2 = ((self._edge_xy - np.asarray(position, dtype=np.float32)) ** 2).sum(1)
+        return self._edge_ids[int(np.argmin(d2))]
 
     def register(self, accident_id, location, sim_time, vehicles_involved):
         """
@@ -37,51 +42,65 @@ class CENBroadcast:
 
         self.accidents[accident_id] = {
             "location": location,
+            "registered_time": sim_time,
             "last_time": sim_time,
             "registered_by_edge": registering_edge,
             "registered_by_name": registering_name,
             "vehicles_involved": set(vehicles_involved)  # store as set for fast lookup
         }
+        self.accidents.move_to_end(accident_id)
 
         print(f"[CEN {registering_name} REGISTER] Accident {accident_id} at {location} involving vehicles {vehicles_involved} (sim time {sim_time:.1f}s)")
 
     def broadcast(self, sim_time, vehicles_dict, graph, comm_range=None):
         """Broadcast accident info to nearby edge nodes and vehicles"""
+        # Stop broadcasting accidents that have been on the air for max_age
+        while self.accidents:
+            acc_id, data = next(iter(self.accidents.items()))
+            if sim_time - data["registered_time"] <= self.max_age:
+                break
+            self.accidents.popitem(last=False)
+            print(f"[CEN {data['registered_by_name']} EXPIRE] Accident {acc_id} no longer broadcast (sim time {sim_time:.1f}s)")
+
+        veh_ids = None
         for acc_id, data in self.accidents.items():
             if sim_time - data["last_time"] >= self.interval:
                 broadcasting_name = data['registered_by_name']
                 broadcasting_edge = data['registered_by_edge']
+                comm_range_sq = comm_range * comm_range
 
                 print(f"[CEN {broadcasting_name} BROADCAST] Accident {acc_id} at {data['location']} being broadcast at sim time {sim_time:.1f}s")
 
                 # --- Notify edge nodes ---
                 if self.edge_nodes:
-                    for edge_id, edge_info in self.edge_nodes.items():
-                        edge_pos = edge_info['position']
-                        distance = math.hypot(edge_pos[0] - data['location'][0], edge_pos[1] - data['location'][1])
-                        if distance <= comm_range:
-                            receiver_name = self.edgecen_names.get(edge_id, edge_id)
-                            print(f"    [CEN {receiver_name} RECEIVED] Accident {acc_id} info received from {broadcasting_name} (distance: {distance:.1f})")
+                    acc_xy = np.asarray(data['location'], dtype=np.float32)
+                    d2 = ((self._edge_xy - acc_xy) ** 2).sum(1)
+                    for i in np.flatnonzero(d2 <= comm_range_sq):
+                        edge_id = self._edge_ids[i]
+                        receiver_name = self.edgecen_names.get(edge_id, edge_id)
+                        print(f"    [CEN {receiver_name} RECEIVED] Accident {acc_id} info received from {broadcasting_name} (distance: {math.sqrt(d2[i]):.1f})")
 
                 # --- Notify vehicles in range (skip involved vehicles) ---
                 if vehicles_dict and self.edge_nodes:
-                    positions_dict = {k: v['position'] for k, v in self.edge_nodes.items()}
-                    for vid, vehicle in vehicles_dict.items():
+                    # Vehicle positions come from their VAR_POSITION subscriptions,
+                    # fetched once per broadcast call
+                    if veh_ids is None:
+                        subs = traci.vehicle.getAllSubscriptionResults()
+                        veh_ids = [vid for vid in vehicles_dict if tc.VAR_POSITION in subs.get(vid, {})]
+                        veh_xy = np.fromiter((c for vid in veh_ids for c in subs[vid][tc.VAR_POSITION]),
+                                             dtype=np.float32, count=2 * len(veh_ids)).reshape(-1, 2)
+
+                    cen_pos = self._edge_xy[self._edge_ids.index(broadcasting_edge)]
+                    d2 = ((veh_xy - cen_pos) ** 2).sum(1)
+                    for i in np.flatnonzero(d2 <= comm_range_sq):
+                        vid = veh_ids[i]
                         if vid in data['vehicles_involved']:
                             continue  # skip vehicles involved in the accident
-                        try:
-                            veh_pos = traci.vehicle.getPosition(vid)
-                            cen_pos = self.edge_nodes[broadcasting_edge]['position']
-                            dist = math.hypot(veh_pos[0] - cen_pos[0], veh_pos[1] - cen_pos[1])
-                            if dist <= comm_range:
-                                vehicle.listen_and_reroute(
-                                    cen=self,
-                                    cen_positions=positions_dict,
-                                    graph=graph,
-                                    accident_edge=acc_id,  # you can pass accident_id or edge if needed
-                                    comm_range=comm_range
-                                )
-                        except:
-                            continue
+                        vehicles_dict[vid].listen_and_reroute(
+                            cen=self,
+                            cen_positions=self._edge_positions,
+                            graph=graph,
+                            comm_range=comm_range
+                        )
 
                 data["last_time"] = sim_time
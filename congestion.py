@@ -1,7 +1,8 @@
 import os
 import sys
 import time
-import traci
+import functools
+from sumo_backend import traci
 import numpy as np
 import skfuzzy as fuzz
 from skfuzzy import control as ctrl
@@ -40,11 +41,106 @@ rule6 = ctrl.Rule(vehicle_count['low'] & avg_speed['low'], congestion['medium'])
 congestion_ctrl = ctrl.ControlSystem([rule1, rule2, rule3, rule4, rule5, rule6])
 congestion_sim = ctrl.ControlSystemSimulation(congestion_ctrl)
 
-# -------------------- Example Query --------------------
-def get_fuzzy_congestion(edge):
-    veh_count = len(traci.edge.getLastStepVehicleIDs(edge))
-    avg_spd = max(traci.edge.getLastStepMeanSpeed(edge),0)
+# -------------------- Lookup Table --------------------
+# The rules are static, so the defuzzified output is precomputed once on a
+# grid of every integer vehicle_count and avg_speed in LUT_SPEED_STEP
+# steps; linear interpolation between speeds then stays within
+# LUT_TOLERANCE of congestion_sim.compute() (see check_congestion_lut).
+# Cells where no rule fires are NaN, the case in which compute() has no
+# output. Between a NaN cell and a live one the table cannot interpolate,
+# so those inputs go to compute() directly.
+MAX_COUNT = int(vehicle_count.universe[-1])
+MAX_SPEED = int(avg_speed.universe[-1])
+LUT_SPEED_STEP = 0.1  # m/s
+LUT_TOLERANCE = 0.05
+LUT_SPEED_CELLS = int(round(MAX_SPEED / LUT_SPEED_STEP))
+
+def fuzzy_compute(veh_count, avg_spd):
+    """congestion_sim.compute() for one input, NaN if no rule fires"""
+    # compute() leaves the previous output in place when it answers a
+    # repeated input from its cache, so start from an empty one
+    congestion_sim.output = {}
     congestion_sim.input['vehicle_count'] = veh_count
     congestion_sim.input['avg_speed'] = avg_spd
     congestion_sim.compute()
-    return congestion_sim.output['congestion']  # 0-10
+    return congestion_sim.output.get('congestion', np.nan)
+
+def batch_compute(veh_counts, avg_spds):
+    """compute() over arrays of inputs at once, NaN where no rule fires"""
+    # A rule fires where the fmin of its antecedent memberships is nonzero
+    # (every rule here is an AND of terms); array compute() only works on
+    # inputs where some rule fires, so it is run on those alone
+    inputs = {'vehicle_count': veh_counts, 'avg_speed': avg_spds}
+    fires = np.zeros(np.shape(veh_counts), dtype=bool)
+    for rule in congestion_ctrl.rules:
+        strength = np.ones(np.shape(veh_counts))
+        for term in rule.antecedent_terms:
+            strength = np.fmin(strength, fuzz.interp_membership(
+                term.parent.universe, term.mf, inputs[term.parent.label]))
+        fires |= strength > 0
+
+    result = np.full(np.shape(veh_counts), np.nan)
+    if fires.any():
+        batch_sim = ctrl.ControlSystemSimulation(congestion_ctrl)
+        batch_sim.input['vehicle_count'] = np.asarray(veh_counts, dtype=float)[fires]
+        batch_sim.input['avg_speed'] = np.asarray(avg_spds, dtype=float)[fires]
+        batch_sim.compute()
+        result[fires] = batch_sim.output['congestion']
+    return result
+
+_lut_counts, _lut_speeds = np.meshgrid(np.arange(MAX_COUNT + 1, dtype=float),
+                                       np.arange(LUT_SPEED_CELLS + 1) * LUT_SPEED_STEP, indexing='ij')
+CONGESTION_LUT = batch_compute(_lut_counts, _lut_speeds).astype(np.float32)
+
+def lookup_congestion(veh_count, avg_spd):
+    """Table congestion (0-10), linearly interpolated between grid speeds"""
+    vc = min(veh_count, MAX_COUNT)
+    sp = min(max(avg_spd, 0), MAX_SPEED)
+    pos = sp / LUT_SPEED_STEP
+    lo = min(int(pos), LUT_SPEED_CELLS)
+    hi = min(lo + 1, LUT_SPEED_CELLS)
+    frac = pos - lo
+    a, b = CONGESTION_LUT[vc, lo], CONGESTION_LUT[vc, hi]
+    if np.isnan(a) or np.isnan(b):
+        value = fuzzy_compute(vc, sp)
+    else:
+        value = a + (b - a) * frac
+    if np.isnan(value):
+        raise ValueError(f"No congestion rule fires for {veh_count} vehicles at {avg_spd:.1f} m/s")
+    return float(value)
+
+def check_congestion_lut(speed_step=0.013):
+    """Largest |lookup_congestion - compute()| over a grid of inputs
+
+    Raises AssertionError if the table and compute() disagree on whether a
+    rule fires, or differ by more than LUT_TOLERANCE.
+    """
+    counts, speeds = np.meshgrid(np.arange(MAX_COUNT + 1, dtype=float),
+                                 np.arange(0, MAX_SPEED, speed_step), indexing='ij')
+    expected = batch_compute(counts, speeds)
+    worst = 0.0
+    for vc, sp, exp in zip(counts.ravel().tolist(), speeds.ravel().tolist(), expected.ravel().tolist()):
+        try:
+            got = lookup_congestion(int(vc), sp)
+        except ValueError:
+            got = np.nan
+        assert np.isnan(got) == np.isnan(exp), f"rule coverage differs at ({vc:.0f}, {sp:.3f})"
+        if not np.isnan(exp):
+            worst = max(worst, abs(got - exp))
+    assert worst <= LUT_TOLERANCE, f"LUT off by {worst:.3f} (> {LUT_TOLERANCE})"
+    return worst
+
+# -------------------- Example Query --------------------
+# Edge inputs only change between simulation steps, so results are cached
+# per (edge, step) and repeated queries within one step skip the inference.
+@functools.lru_cache(maxsize=256)
+def _compute_congestion(edge, sim_time):
+    veh_count = len(traci.edge.getLastStepVehicleIDs(edge))
+    avg_spd = max(traci.edge.getLastStepMeanSpeed(edge),0)
+    return lookup_congestion(veh_count, avg_spd)  # 0-10
+
+def get_fuzzy_congestion(edge):
+    return _compute_congestion(edge, int(traci.simulation.getTime()))
+
+if __name__ == "__main__":
+    print(f"Congestion LUT max error vs compute(): {check_congestion_lut():.4f}")
@@ -4,7 +4,7 @@ This generates vehicle routes as a graph of nodes (A–I) and edges.
 
 Main Features:
 1. Defines nodes, edges, and boundary nodes of the network.
-2. Recursively computes all possible routes up to a given depth
+2. Iteratively (depth-first) computes all possible routes up to a given depth
    while avoiding cycles, and stores valid boundary-to-boundary paths.
 3. Specifies multiple vehicle types (fast car, slow car, ambulance)
    with different speed and acceleration parameters.
@@ -37,25 +37,25 @@ edges = {
 
 # Boundary nodes (routes should end when reaching these)
 boundary_nodes = ["A", "B", "C", "D", "F", "G", "H", "I"]
+boundary_set = frozenset(boundary_nodes)
 
-# Recursive function to find valid routes in the graph
-def find_routes(start, path=None, max_depth=6):
-    if path is None:
-        path = [start]          # Initialize path with the start node
-    else:
-        path = path + [start]   # Extend path with the current node
-
+# Stack-based depth-first search to find valid routes in the graph
+def find_routes(start, max_depth=6):
     routes = []
-    # If we reach a boundary node (and not the starting point), save the route
-    if start in boundary_nodes and len(path) > 1:
-        routes.append(path)
-    # Stop recursion if maximum path length is reached
-    if len(path) >= max_depth:
-        return routes
-    # Explore neighbors recursively, avoiding cycles
-    for neighbor in edges[start]:
-        if neighbor not in path:
-            routes.extend(find_routes(neighbor, path, max_depth))
+    # Each entry: (current node, path as a tuple, visited nodes as a frozenset)
+    stack = [(start, (start,), frozenset([start]))]
+    while stack:
+        node, path, visited = stack.pop()
+        # If we reach a boundary node (and not the starting point), save the route
+        if node in boundary_set and len(path) > 1:
+            routes.append(path)
+        # Stop extending if maximum path length is reached
+        if len(path) >= max_depth:
+            continue
+        # Push neighbors in reverse so they are popped in their listed order, avoiding cycles
+        for neighbor in reversed(edges[node]):
+            if neighbor not in visited:
+                stack.append((neighbor, path + (neighbor,), visited | {neighbor}))
     return routes
 
 # Generate all normal routes by starting search from each node
@@ -1,14 +1,15 @@
 import sys
 import os
-import time
 import random
 import xml.etree.ElementTree as ET
-import math
 import uuid
-from collections import defaultdict
+from collections import OrderedDict, defaultdict, deque, namedtuple
+import numpy as np
+from scipy.spatial import cKDTree
 from cen_broadcast import CENBroadcast
 from vehicle import Vehicle
-import traci
+from sumo_backend import traci, USE_GUI
+import traci.constants as tc
 import sumolib
 
 # -------------------- SUMO PATH SETUP --------------------
@@ -20,12 +21,17 @@ if tools not in sys.path:
     sys.path.append(tools)
 from best_erv import select_best_ambulance
 # -------------------- SUMO SETUP --------------------
-sumoBinary = sumolib.checkBinary("sumo-gui")
+sumoBinary = sumolib.checkBinary("sumo-gui" if USE_GUI else "sumo")
 sumoConfig = "simulation.sumocfg"
+GUI_DELAY_MS = 500  # sumo-gui step delay; headless runs are not paced at all
 vehicles_dict = {}
 V2V_COMMUNICATION_RANGE = 200.0
 MAX_HOP_COUNT = 5
+MAX_HISTORY = 4096  # delivered accident ids kept for duplicate suppression
 COLLISION_DISTANCE = 7.5
+COLLISION_DISTANCE_SQ = COLLISION_DISTANCE ** 2
+KDTREE_MIN_VEHICLES = 50  # below this, a dense pairwise check beats building a tree
+SUBSCRIBED_VARS = [tc.VAR_POSITION, tc.VAR_ROAD_ID, tc.VAR_EDGES]
 
 # Edge node positions (fixed infrastructure nodes)
 EDGE_NODE_POSITIONS = {
@@ -37,18 +43,39 @@ EDGE_NODE_POSITIONS = {
 
 # Global state
 edge_nodes = {}
+EDGE_IDS = []
+EDGE_COORDS = np.empty((0, 2))
+EDGE_TREE = cKDTree(EDGE_COORDS)
+# Non-ambulance vehicle positions, structure-of-arrays: each vehicle gets a
+# stable slot at spawn time in VID_TO_IDX / IDX_TO_VID, and X / Y / ACTIVE
+# hold this step's coordinates and presence per slot (grown by doubling).
+# Slots of arrived vehicles go to FREE_SLOTS and are handed out again, so
+# the arrays track the vehicles in the network rather than every spawn.
+# ACTIVE_IDX lists the active slots; the KD-tree over them is built on first
+# use after each simulation step.
+VID_TO_IDX = {}
+IDX_TO_VID = []
+FREE_SLOTS = []
+X = np.empty(1024, dtype=np.float64)
+Y = np.empty(1024, dtype=np.float64)
+ACTIVE = np.zeros(1024, dtype=bool)
+ACTIVE_IDX = np.empty(0, dtype=np.intp)
+VEHICLE_TREE = None
 broadcasted_accidents = set()
-message_history = {}
+DELIVERED_IDS = OrderedDict()  # accident_id -> None for alerts already at an edge node, oldest first
 hop_count_stats = defaultdict(int)
 reported_collisions = set()
 total_accidents = 0
 successful_notifications = 0
+# Vehicles present and their positions, refreshed once per simulation step
+STEP_CACHE = {'ids': set(), 'pos': {}}
 
 # -------------------- PARSE ROUTES AND VEHICLE TYPES --------------------
 rou_file = "vehicles.rou.xml"
 tree = ET.parse(rou_file)
 root = tree.getroot()
 routes = [r.attrib['id'] for r in root.findall("route") if not r.attrib['id'].startswith('routeAmbulance')]
+route_edges = {r.attrib['id']: r.attrib['edges'].split() for r in root.findall("route")}
 vtypes = {v.attrib['id']: v for v in root.findall("vType") if v.attrib['id'] != 'ambulance'}
 
 print("Loaded routes:", len(routes))
@@ -59,8 +86,16 @@ SPAWN_INTERVAL = 20
 VEHICLE_COUNTER = 0
 
 # -------------------- V2V MESSAGE CLASS --------------------
+# Emergency details shared, unchanged, by every hop of one alert
+EmergencyPayload = namedtuple('EmergencyPayload', 'accident_id vehicles_involved location severity timestamp')
+
+# A V2VMessage records a message as delivered to an edge node; propagation
+# itself only carries (vehicle, position, hops, path) entries
 class V2VMessage:
-    def __init__(self, message_id, source_id, message_type, payload, origin_location):
+    __slots__ = ('message_id', 'source_id', 'message_type', 'payload', 'origin_location',
+                 'hop_count', 'propagation_path', 'timestamp')
+
+    def __init__(self, message_id, source_id, message_type, payload, origin_location, timestamp):
         self.message_id = message_id
         self.source_id = source_id
         self.message_type = message_type
@@ -68,8 +103,7 @@ class V2VMessage:
         self.origin_location = origin_location
         self.hop_count = 0
         self.propagation_path = [source_id]
-        self.timestamp = traci.simulation.getTime()
-        self.reached_edge_node = False
+        self.timestamp = timestamp
 
     def increment_hop(self, next_node):
         self.hop_count += 1
@@ -77,6 +111,7 @@ class V2VMessage:
 
 # -------------------- INITIALIZE EDGE NODES --------------------
 def initialize_edge_nodes():
+    global EDGE_IDS, EDGE_COORDS, EDGE_TREE
     print("EDGE NODE INITIALIZATION")
     print("=" * 50)
     for node_id, position in EDGE_NODE_POSITIONS.items():
@@ -91,126 +126,163 @@ def initialize_edge_nodes():
         print(f"Edge Node: {node_id} - Position: {position}")
     print("=" * 50)
 
+    # Edge nodes never move, so their KD-tree is built once
+    EDGE_IDS = list(EDGE_NODE_POSITIONS)
+    EDGE_COORDS = np.array(list(EDGE_NODE_POSITIONS.values()), dtype=np.float64)
+    EDGE_TREE = cKDTree(EDGE_COORDS)
+
 # -------------------- HELPER FUNCTIONS --------------------
 # -------------------- HELPER FUNCTIONS WITH LOGGING --------------------
 def get_vehicle_position(vehicle_id):
-    try:
-        if vehicle_id in traci.vehicle.getIDList():
-            return traci.vehicle.getPosition(vehicle_id)
-    except:
-        pass
-    return None
-
-def calculate_distance(pos1, pos2):
-    if pos1 and pos2:
-        return math.hypot(pos1[0] - pos2[0], pos1[1] - pos2[1])
-    return float('inf')
+    return STEP_CACHE['pos'].get(vehicle_id)
+
+def assign_vehicle_slot(vehicle_id):
+    global X, Y, ACTIVE
+    if not FREE_SLOTS and len(IDX_TO_VID) == len(X):
+        X = np.concatenate([X, np.empty_like(X)])
+        Y = np.concatenate([Y, np.empty_like(Y)])
+        ACTIVE = np.concatenate([ACTIVE, np.zeros_like(ACTIVE)])
+    if FREE_SLOTS:
+        slot = FREE_SLOTS.pop()
+        IDX_TO_VID[slot] = vehicle_id
+    else:
+        slot = len(IDX_TO_VID)
+        IDX_TO_VID.append(vehicle_id)
+    VID_TO_IDX[vehicle_id] = slot
+
+def release_vehicle_slot(vehicle_id):
+    slot = VID_TO_IDX.pop(vehicle_id, None)
+    if slot is not None:
+        IDX_TO_VID[slot] = None
+        ACTIVE[slot] = False
+        FREE_SLOTS.append(slot)
+
+def get_vehicle_tree():
+    global VEHICLE_TREE
+    if VEHICLE_TREE is None:
+        VEHICLE_TREE = cKDTree(np.column_stack((X[ACTIVE_IDX], Y[ACTIVE_IDX])))
+    return VEHICLE_TREE
+
+def find_close_pairs():
+    """Pairs (i, j), i < j, of positions in ACTIVE_IDX closer than COLLISION_DISTANCE"""
+    if len(ACTIVE_IDX) < KDTREE_MIN_VEHICLES:
+        # One broadcast N x N pass on float32 squared distances
+        xs = X[ACTIVE_IDX].astype(np.float32)
+        ys = Y[ACTIVE_IDX].astype(np.float32)
+        dx = xs[:, None] - xs[None, :]
+        dy = ys[:, None] - ys[None, :]
+        d2 = dx * dx + dy * dy
+        return np.argwhere(np.triu(d2 < COLLISION_DISTANCE_SQ, k=1)).tolist()
+    return get_vehicle_tree().query_pairs(COLLISION_DISTANCE, output_type='ndarray').tolist()
 
 def find_vehicles_in_range(source_position, exclude_vehicle=None):
-    vehicles_in_range = []
-    for vehicle_id in traci.vehicle.getIDList():
-        if vehicle_id == exclude_vehicle or vehicle_id.startswith('ambulance'):
-            continue
-        vehicle_pos = get_vehicle_position(vehicle_id)
-        if vehicle_pos:
-            distance = calculate_distance(source_position, vehicle_pos)
-            if distance <= V2V_COMMUNICATION_RANGE:
-                vehicles_in_range.append((vehicle_id, distance, vehicle_pos))
-    vehicles_in_range.sort(key=lambda x: x[1])
+    """(vehicle_id, squared distance, position) of vehicles in V2V range, nearest first"""
+    slots = ACTIVE_IDX[get_vehicle_tree().query_ball_point(source_position, V2V_COMMUNICATION_RANGE)]
+    if exclude_vehicle in VID_TO_IDX:
+        slots = slots[slots != VID_TO_IDX[exclude_vehicle]]
+    xs, ys = X[slots], Y[slots]
+    dx = xs - source_position[0]
+    dy = ys - source_position[1]
+    d2 = dx * dx + dy * dy
+    order = np.argsort(d2, kind='stable').tolist()
+    slots, xs, ys, d2 = slots.tolist(), xs.tolist(), ys.tolist(), d2.tolist()
+    vehicles_in_range = [(IDX_TO_VID[slots[k]], d2[k], (xs[k], ys[k])) for k in order]
     if vehicles_in_range:
         print(f"    Vehicles in range of {exclude_vehicle}: {[v[0] for v in vehicles_in_range]}")
     return vehicles_in_range
 
 def find_edge_nodes_in_range(position):
-    edge_nodes_in_range = []
-    for edge_id, edge_info in edge_nodes.items():
-        distance = calculate_distance(position, edge_info['position'])
-        if distance <= V2V_COMMUNICATION_RANGE:
-            edge_nodes_in_range.append((edge_id, distance))
-    edge_nodes_in_range.sort(key=lambda x: x[1])
+    """(edge_id, squared distance) of edge nodes in V2V range, nearest first"""
+    idx = EDGE_TREE.query_ball_point(position, V2V_COMMUNICATION_RANGE)
+    diff = EDGE_COORDS[idx] - position
+    d2 = (diff * diff).sum(1)
+    order = np.argsort(d2, kind='stable').tolist()
+    d2 = d2.tolist()
+    edge_nodes_in_range = [(EDGE_IDS[idx[k]], d2[k]) for k in order]
     if edge_nodes_in_range:
         print(f"    Edge nodes in range at pos {position}: {[e[0] for e in edge_nodes_in_range]}")
     return edge_nodes_in_range
 
-def propagate_v2v_message(message, current_vehicle_id, current_position):
-    print(f"    [V2V] Vehicle {current_vehicle_id} propagating message {message.message_id}, hop {message.hop_count}")
-    if message.hop_count >= MAX_HOP_COUNT:
-        print(f"        [V2V] Message {message.message_id} reached max hops ({MAX_HOP_COUNT})")
-        return False
-
-    # Check edge nodes in range
-    edge_nodes_in_range = find_edge_nodes_in_range(current_position)
-    for edge_id, distance in edge_nodes_in_range:
-        if message.message_id not in edge_nodes[edge_id]['message_cache']:
-            edge_nodes[edge_id]['message_cache'].add(message.message_id)
-            edge_nodes[edge_id]['total_messages_received'] += 1
-            if message.message_type == "EMERGENCY":
-                edge_nodes[edge_id]['unique_accidents_reported'].add(message.payload.get('accident_id'))
-                alert_info = {
-                    'accident_id': message.payload.get('accident_id'),
-                    'vehicles_involved': message.payload.get('vehicles_involved', []),
-                    'location': message.payload.get('location'),
-                    'timestamp': message.payload.get('timestamp'),
-                    'received_at': traci.simulation.getTime(),
-                    'hop_count': message.hop_count,
-                    'propagation_path': message.propagation_path.copy()
-                }
-                edge_nodes[edge_id]['accident_alerts_received'].append(alert_info)
-            message.reached_edge_node = True
-            hop_count_stats[message.hop_count] += 1
-            print(f"        [CEN] Edge node {edge_id} received message {message.message_id} about accident {message.payload.get('accident_id')}")
-            return True
-
-    # Propagate to vehicles in range
-    vehicles_in_range = find_vehicles_in_range(current_position, exclude_vehicle=current_vehicle_id)
-    propagation_successful = False
-    for vehicle_id, distance, vehicle_pos in vehicles_in_range:
-        if vehicle_id in message.propagation_path:
+def mark_delivered(accident_id):
+    DELIVERED_IDS[accident_id] = None
+    DELIVERED_IDS.move_to_end(accident_id)
+    if len(DELIVERED_IDS) > MAX_HISTORY:
+        DELIVERED_IDS.popitem(last=False)
+
+def propagate_v2v_message(message_id, message_type, payload, source_id, source_position):
+    # Breadth-first flood from the source: the first edge node reached is
+    # reached with the fewest hops. Queue entries carry (vehicle, position,
+    # hops, path) so no message object is built per hop.
+    emergency = message_type == "EMERGENCY"
+    if emergency and payload.accident_id in DELIVERED_IDS:
+        return True
+    queue = deque([(source_id, source_position, 0, [source_id])])
+    visited = {source_id}
+    while queue:
+        current_vehicle_id, current_position, hops, path = queue.popleft()
+        print(f"    [V2V] Vehicle {current_vehicle_id} propagating message {message_id}, hop {hops}")
+        if hops >= MAX_HOP_COUNT:
+            print(f"        [V2V] Message {message_id} reached max hops ({MAX_HOP_COUNT})")
             continue
-        next_message = V2VMessage(
-            message.message_id,
-            vehicle_id,
-            message.message_type,
-            message.payload,
-            message.origin_location
-        )
-        next_message.hop_count = message.hop_count + 1
-        next_message.propagation_path = message.propagation_path.copy()
-        next_message.increment_hop(vehicle_id)
-        if next_message.message_id not in message_history:
-            message_history[next_message.message_id] = []
-        message_history[next_message.message_id].append(next_message)
-        print(f"        [V2V] Vehicle {current_vehicle_id} sending message {message.message_id} to vehicle {vehicle_id}")
-        success = propagate_v2v_message(next_message, vehicle_id, vehicle_pos)
-        if success:
-            propagation_successful = True
-            break
-    return propagation_successful
+
+        # Check edge nodes in range
+        edge_nodes_in_range = find_edge_nodes_in_range(current_position)
+        for edge_id, _ in edge_nodes_in_range:
+            if message_id not in edge_nodes[edge_id]['message_cache']:
+                message = V2VMessage(message_id, source_id, message_type, payload,
+                                     payload.location if emergency else source_position,
+                                     payload.timestamp if emergency else None)
+                for hop_vehicle in path[1:]:
+                    message.increment_hop(hop_vehicle)
+                edge_nodes[edge_id]['message_cache'].add(message_id)
+                edge_nodes[edge_id]['total_messages_received'] += 1
+                if emergency:
+                    edge_nodes[edge_id]['unique_accidents_reported'].add(payload.accident_id)
+                    alert_info = {
+                        'accident_id': payload.accident_id,
+                        'vehicles_involved': payload.vehicles_involved,
+                        'location': payload.location,
+                        'timestamp': payload.timestamp,
+                        'received_at': payload.timestamp,  # propagation completes within the step
+                        'hop_count': message.hop_count,
+                        'propagation_path': message.propagation_path
+                    }
+                    edge_nodes[edge_id]['accident_alerts_received'].append(alert_info)
+                    mark_delivered(payload.accident_id)
+                hop_count_stats[message.hop_count] += 1
+                print(f"        [CEN] Edge node {edge_id} received message {message_id} about accident {payload.accident_id if emergency else None}")
+                return True
+
+        # Queue up vehicles in range that have not been reached yet
+        vehicles_in_range = find_vehicles_in_range(current_position, exclude_vehicle=current_vehicle_id)
+        for vehicle_id, _, vehicle_pos in vehicles_in_range:
+            if vehicle_id in visited:
+                continue
+            visited.add(vehicle_id)
+            print(f"        [V2V] Vehicle {current_vehicle_id} sending message {message_id} to vehicle {vehicle_id}")
+            queue.append((vehicle_id, vehicle_pos, hops + 1, path + [vehicle_id]))
+    return False
 
 def broadcast_emergency_alert(source_vehicle_id, accident_location, collision_pair, accident_id):
     global successful_notifications
+    if accident_id in DELIVERED_IDS:
+        print(f"    [V2V] Accident {accident_id} already reported to edge nodes, not re-broadcasting")
+        return True
     print(f"[ACCIDENT] Accident {accident_id} occurred between vehicles {collision_pair} at location {accident_location}")
     source_position = get_vehicle_position(source_vehicle_id)
     if not source_position:
         print(f"    [WARNING] Source vehicle {source_vehicle_id} position not found")
         return False
     message_id = f"EMERGENCY_{uuid.uuid4().hex[:8]}"
-    emergency_payload = {
-        'accident_id': accident_id,
-        'vehicles_involved': collision_pair,
-        'location': accident_location,
-        'severity': 'HIGH',
-        'timestamp': traci.simulation.getTime()
-    }
-    message = V2VMessage(
-        message_id,
-        source_vehicle_id,
-        "EMERGENCY",
-        emergency_payload,
-        accident_location
+    emergency_payload = EmergencyPayload(
+        accident_id=accident_id,
+        vehicles_involved=collision_pair,
+        location=accident_location,
+        severity='HIGH',
+        timestamp=traci.simulation.getTime()
     )
-    message_history[message_id] = [message]
-    success = propagate_v2v_message(message, source_vehicle_id, source_position)
+    success = propagate_v2v_message(message_id, "EMERGENCY", emergency_payload,
+                                    source_vehicle_id, source_position)
     if success:
         successful_notifications += 1
         print(f"    [SUCCESS] Emergency alert {message_id} successfully propagated to edge nodes")
@@ -223,7 +295,8 @@ def broadcast_emergency_alert(source_vehicle_id, accident_location, collision_pa
 traci.start([sumoBinary, "-c", sumoConfig,
              "--collision.action", "none",
              "--collision.check-junctions", "true",
-             "--ignore-route-errors", "true"], port=8813)
+             "--ignore-route-errors", "true"]
+            + (["--delay", str(GUI_DELAY_MS)] if USE_GUI else []), port=8813)
 
 # -------------------- INITIALIZE EDGE NODES --------------------
 initialize_edge_nodes()
@@ -251,6 +324,7 @@ ambulance_parking_routes = {
 for vid, route in ambulance_parking_routes.items():
     try:
         traci.vehicle.add(vid, routeID=route, typeID="ambulance", depart=0)
+        traci.vehicle.subscribe(vid, SUBSCRIBED_VARS)
         traci.vehicle.setSpeed(vid, 0)
         traci.vehicle.setMaxSpeed(vid, 0)
         traci.vehicle.setEmergencyDecel(vid, 1000)
@@ -278,13 +352,15 @@ def spawn_vehicle(step):
     t = random.choice(list(vtypes.keys()))
     try:
         traci.vehicle.add(vid, routeID=r, typeID=t, depart=step)
+        traci.vehicle.subscribe(vid, SUBSCRIBED_VARS)
         traci.vehicle.setEmergencyDecel(vid, 1000)
         traci.vehicle.setTau(vid, 0)
         traci.vehicle.setMinGap(vid, 0)
         max_speed = float(vtypes[t].attrib.get("maxSpeed", 13.9))
         speed = random.uniform(max_speed*0.3, max_speed)
         traci.vehicle.setSpeed(vid, speed)
-        vehicles_dict[vid] = Vehicle(veh_id=vid, destination=traci.vehicle.getRoute(vid)[-1])
+        assign_vehicle_slot(vid)
+        vehicles_dict[vid] = Vehicle(veh_id=vid, destination=route_edges[r][-1])
     except Exception as e:
         print(f"Failed to spawn vehicle {vid}: {e}")
 
@@ -298,73 +374,87 @@ MAX_STEPS = 500
 while step < MAX_STEPS:
     traci.simulationStep()
     step += 1
-    time.sleep(0.5)
+    for vid in traci.simulation.getArrivedIDList():
+        release_vehicle_slot(vid)
 
     # Spawn new vehicles
     if step % SPAWN_INTERVAL == 0:
         for _ in range(random.randint(1, 2)):
             spawn_vehicle(step)
 
-    # Track vehicles
-    vehicles = [v for v in traci.vehicle.getIDList() if not v.startswith('ambulance')]
-    positions = {vid: get_vehicle_position(vid) for vid in vehicles}
+    # Refresh the step cache: one ID-list call plus one batched subscription fetch
+    # (vehicles still waiting for insertion are subscribed but not in the ID list)
+    id_list = traci.vehicle.getIDList()
+    subs = traci.vehicle.getAllSubscriptionResults()
+    STEP_CACHE['ids'] = set(id_list)
+    STEP_CACHE['pos'] = {vid: res[tc.VAR_POSITION] for vid, res in subs.items() if vid in STEP_CACHE['ids']}
+
+    # Track vehicles: write this step's positions into their X / Y slots
+    vehicles = [v for v in id_list if v in VID_TO_IDX]
+    slots = np.fromiter((VID_TO_IDX[v] for v in vehicles), dtype=np.intp, count=len(vehicles))
+    ACTIVE[:] = False
+    ACTIVE[slots] = True
+    X[slots] = np.fromiter((STEP_CACHE['pos'][v][0] for v in vehicles), dtype=np.float64, count=len(vehicles))
+    Y[slots] = np.fromiter((STEP_CACHE['pos'][v][1] for v in vehicles), dtype=np.float64, count=len(vehicles))
+    ACTIVE_IDX = np.flatnonzero(ACTIVE)
+    VEHICLE_TREE = None
+
+    # Detect new collisions over this step's positions (the same arrays, and
+    # the KD-tree if one gets built, answer the V2V range queries later on)
+    ids = [IDX_TO_VID[s] for s in ACTIVE_IDX.tolist()]
+    close_pairs = []
+    if len(ids) > 1:
+        for i, j in find_close_pairs():
+            close_pairs.append((i, j) if ids[i] < ids[j] else (j, i))
+        close_pairs.sort()
 
-    # Detect new collisions
     new_collisions = []
-    for vid1, pos1 in positions.items():
-        for vid2, pos2 in positions.items():
-            if vid1 >= vid2:
-                continue
-            distance = calculate_distance(pos1, pos2)
-            pair = tuple(sorted([vid1, vid2]))
-            if distance < COLLISION_DISTANCE and pair not in reported_collisions:
-                for v in pair:
-                    try:
-                        traci.vehicle.setSpeed(v, 0)
-                        traci.vehicle.setColor(v, (255,0,0,255))
-                        current_edge = traci.vehicle.getRoadID(v)
-                        current_pos = traci.vehicle.getLanePosition(v)
-                        traci.vehicle.setStop(v, edgeID=current_edge, pos=current_pos, duration=999999)
-                    except:
-                        pass
-                reported_collisions.add(pair)
-                new_collisions.append((pair, pos1))
-                total_accidents += 1
-                print(f"[ACCIDENT] Vehicles involved: {pair} at position {pos1} (Total accidents: {total_accidents})")
-
-    # Register accidents in CEN
-    for collision_pair, location in new_collisions:
-        accident_id = f"ACC_{total_accidents:03d}"
-        x, y = location
+    for i, j in close_pairs:
+        pair = (ids[i], ids[j])
+        pos1 = get_vehicle_position(ids[i])
+        if pair not in reported_collisions:
+            for v in pair:
+                try:
+                    traci.vehicle.setSpeed(v, 0)
+                    traci.vehicle.setColor(v, (255,0,0,255))
+                    current_edge = traci.vehicle.getRoadID(v)
+                    current_pos = traci.vehicle.getLanePosition(v)
+                    traci.vehicle.setStop(v, edgeID=current_edge, pos=current_pos, duration=999999)
+                except:
+                    pass
+            reported_collisions.add(pair)
+            total_accidents += 1
+            new_collisions.append((pair, pos1, f"ACC_{total_accidents:03d}"))
+            print(f"[ACCIDENT] Vehicles involved: {pair} at position {pos1} (Total accidents: {total_accidents})")
+
+    # Register accidents in CEN. Everything the ambulance selection needs is
+    # read once per step from this step's subscriptions, so the per-accident
+    # work below is plain Python on cached values.
+    if new_collisions:
         sim_time = traci.simulation.getTime()
+        amb_positions = {amb: STEP_CACHE['pos'][amb] for amb in ambulance_readiness
+                         if amb in STEP_CACHE['pos']}
+        amb_edges = {amb: subs[amb][tc.VAR_ROAD_ID] for amb in amb_positions}
+    for collision_pair, location, accident_id in new_collisions:
+        x, y = location
         source_vehicle = collision_pair[0]
-        cen.register(accident_id, (x, y), sim_time, source_vehicle)
+        cen.register(accident_id, (x, y), sim_time, collision_pair)
 
-        def detect_accident(veh1, veh2, x, y):
-            """Dummy implementation: returns the current edge of veh1 as the accident edge."""
-            try:
-                return traci.vehicle.getRoadID(veh1)
-            except Exception:
-                return None
+        # Relay the alert vehicle-to-vehicle towards the edge nodes
+        broadcast_emergency_alert(source_vehicle, (x, y), collision_pair, accident_id)
 
-        accident_edge = detect_accident(collision_pair[0], collision_pair[1], x, y)
-
-            # Collect ambulance positions
-        positions = {}
-        for amb in ambulance_readiness.keys():
-                try:
-                    positions[amb] = traci.vehicle.getPosition(amb)
-                except Exception:
-                    continue
+        # The accident edge is the current edge of the first vehicle involved
+        accident_edge = subs[source_vehicle].get(tc.VAR_ROAD_ID) or None
 
-            # GA call
-        best_ambulance = select_best_ambulance(x, y, positions, accident_edge)
+        # GA call
+        best_ambulance = select_best_ambulance(x, y, amb_positions, accident_edge, amb_edges)
 
-    # Vehicles listen to CEN broadcasts
+    # Vehicles listen to CEN broadcasts (presence comes from this step's ID set)
+    active_ids = STEP_CACHE['ids']
     for vid, vehicle in vehicles_dict.items():
-        if vid not in traci.vehicle.getIDList():
+        if vid not in active_ids:
             continue
-        vehicle.listen_and_reroute(cen, {k:v['position'] for k,v in edge_nodes.items()}, graph, comm_range=V2V_COMMUNICATION_RANGE)
+        vehicle.listen_and_reroute(cen, EDGE_NODE_POSITIONS, graph, comm_range=V2V_COMMUNICATION_RANGE)
 
     # Periodic CEN broadcast
     cen.broadcast(traci.simulation.getTime(), vehicles_dict=vehicles_dict, graph=graph, comm_range=V2V_COMMUNICATION_RANGE)
@@ -0,0 +1,17 @@
+# sumo_backend.py
+# Set LIBSUMO_AS_TRACI to run headless with SUMO loaded in-process (libsumo),
+# which skips the TraCI socket entirely. Every module imports traci from here
+# so they all talk to the same backend.
+import os
+
+USE_LIBSUMO = "LIBSUMO_AS_TRACI" in os.environ
+if USE_LIBSUMO:
+    try:
+        import libsumo as traci
+    except ImportError:
+        import traci
+else:
+    import traci
+
+# sumo-gui needs the TraCI socket; libsumo runs are headless
+USE_GUI = not USE_LIBSUMO
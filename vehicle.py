@@ -1,36 +1,139 @@
 # vehicle.py
 import math
-import traci
 import random
+import heapq
+import numpy as np
+from scipy.spatial import cKDTree
+from sumo_backend import traci
+import traci.constants as tc
+import sumolib
+
+# -------------------- GRAPH NODE POSITIONS --------------------
+# Junction coordinates of the A-I grid, read from the compiled network so
+# they are in the same frame as vehicle positions (netconvert shifts the
+# nodes.xml coordinates by netOffset); the KD-tree maps a position to the
+# nearest graph node
+NET_FILE = "output.net.xml"
+_net = sumolib.net.readNet(NET_FILE)
+NODE_POSITIONS = {node_id: _net.getNode(node_id).getCoord() for node_id in "ABCDEFGHI"}
+del _net
+GRAPH_NODE_IDS = list(NODE_POSITIONS)
+GRAPH_NODE_TREE = cKDTree(np.array(list(NODE_POSITIONS.values()), dtype=np.float64))
+
+# -------------------- ACO PARAMETERS --------------------
+USE_ACO = False  # False: reroute along precomputed shortest paths instead of ants
+ACO_NUM_ANTS = 6
+ACO_MAX_HOPS = 20
+ACO_ALPHA = 1.0
+ACO_BETA = 2.0
+ACO_EVAPORATION = 0.1
+
+# -------------------- ACO GRAPH --------------------
+# Road graphs are compiled once into index arrays in CSR layout: the
+# neighbours of node u sit in nbrs[indptr[u]:indptr[u + 1]], with matching
+# edge costs in costs and heuristic weights (1/cost)**ACO_BETA in eta.
+# Ants then walk ints instead of hashing node names.
+# The graph is small enough to also keep every shortest path for every
+# possible blocked node: paths[blocked][src][dst] is a list of node indices
+# (blocked -1 meaning nothing is blocked).
+_COMPILED_GRAPHS = {}  # id(graph) -> (graph, compiled)
+
+def _shortest_paths(indptr, nbrs, costs, src, blocked):
+    """Dijkstra from src around the blocked node: {dst: [src, ..., dst]}"""
+    dist = {src: 0}
+    prev = {}
+    heap = [(0, src)]
+    while heap:
+        d, u = heapq.heappop(heap)
+        if d > dist[u]:
+            continue
+        for k in range(indptr[u], indptr[u + 1]):
+            v = nbrs[k]
+            if v == blocked:
+                continue
+            nd = d + costs[k]
+            if nd < dist.get(v, float("inf")):
+                dist[v] = nd
+                prev[v] = u
+                heapq.heappush(heap, (nd, v))
+
+    paths = {}
+    for dst in prev:
+        path = [dst]
+        while path[-1] != src:
+            path.append(prev[path[-1]])
+        paths[dst] = path[::-1]
+    return paths
+
+def compile_graph(graph):
+    entry = _COMPILED_GRAPHS.get(id(graph))
+    if entry is not None and entry[0] is graph:
+        return entry[1]
+
+    names = list(graph)
+    for neighbors in graph.values():
+        names.extend(n for n, _ in neighbors if n not in graph and n not in names)
+    index = {n: i for i, n in enumerate(names)}
+
+    indptr, nbrs, costs = [0], [], []
+    for n in names:
+        for m, c in graph.get(n, []):
+            nbrs.append(index[m])
+            costs.append(c)
+        indptr.append(len(nbrs))
+
+    eta = [(1.0 / c) ** ACO_BETA for c in costs]
+    paths = {blocked: [_shortest_paths(indptr, nbrs, costs, src, blocked) for src in range(len(names))]
+             for blocked in range(-1, len(names))}
+    compiled = (names, index, indptr, nbrs, costs, eta, paths)
+    _COMPILED_GRAPHS[id(graph)] = (graph, compiled)
+    return compiled
+
+def edge_nodes(edge_id):
+    """(from, to) junction names of a "<from>_<to>" edge id, () for any other edge"""
+    parts = edge_id.split("_")
+    return tuple(parts) if len(parts) == 2 and not edge_id.startswith(":") else ()
 
 class Vehicle:
+    __slots__ = ('veh_id', 'destination', 'current_edge', 'route', 'position',
+                 'accidents_received', '_pheromone')
+
     def __init__(self, veh_id, destination):
         self.veh_id = veh_id
         self.destination = destination
         self.current_edge = None
         self.route = []
+        self.position = None
         self.accidents_received = set()  # track accident IDs already received
+        self._pheromone = []  # ACO pheromone per graph node, reused across reroutes
 
     def update_position(self):
-        try:
-            self.current_edge = traci.vehicle.getRoadID(self.veh_id)
-            self.route = traci.vehicle.getRoute(self.veh_id)
-        except:
-            pass
+        # Read from the vehicle's subscription (VAR_POSITION, VAR_ROAD_ID,
+        # VAR_EDGES), already fetched with the last simulation step
+        res = traci.vehicle.getSubscriptionResults(self.veh_id)
+        self.position = res.get(tc.VAR_POSITION)
+        self.current_edge = res.get(tc.VAR_ROAD_ID, self.current_edge)
+        self.route = res.get(tc.VAR_EDGES, self.route)
 
-    def distance_to_cen(self, cen_pos):
-        try:
-            veh_pos = traci.vehicle.getPosition(self.veh_id)
-            return math.hypot(veh_pos[0] - cen_pos[0], veh_pos[1] - cen_pos[1])
-        except:
+    def distance_sq_to_cen(self, cen_pos):
+        if self.position is None:
             return float('inf')
+        dx = self.position[0] - cen_pos[0]
+        dy = self.position[1] - cen_pos[1]
+        return dx * dx + dy * dy
+
+    def distance_to_cen(self, cen_pos):
+        return math.sqrt(self.distance_sq_to_cen(cen_pos))
 
     def listen_and_reroute(self, cen, cen_positions, graph, comm_range=200):
+        # Nothing on the air that this vehicle has not already handled
+        if self.accidents_received.issuperset(cen.accidents):
+            return
+
         self.update_position()
-        try:
-            veh_pos = traci.vehicle.getPosition(self.veh_id)
-        except:
+        if self.position is None:
             return
+        comm_range_sq = comm_range * comm_range
 
         for acc_id, data in cen.accidents.items():
             # Skip accidents already processed
@@ -44,20 +147,20 @@ class Vehicle:
             if broadcasting_edge not in cen_positions:
                 continue
 
-            dist = self.distance_to_cen(cen_positions[broadcasting_edge])
-            if dist <= comm_range:
+            dist_sq = self.distance_sq_to_cen(cen_positions[broadcasting_edge])
+            if dist_sq <= comm_range_sq:
                 # Mark accident as received
                 self.accidents_received.add(acc_id)
 
                 print(f"[V2I] Vehicle {self.veh_id} received accident {acc_id} info from CEN {broadcasting_cen_name} "
-                      f"at t={traci.simulation.getTime():.1f}s (distance {dist:.1f})")
+                      f"at t={traci.simulation.getTime():.1f}s (distance {math.sqrt(dist_sq):.1f})")
 
-                # Determine the exact edge of the accident
-                accident_edge_actual = self.map_position_to_edge(accident_pos, graph)
+                # Determine the junction nearest to the accident
+                accident_node = self.map_position_to_node(accident_pos, graph)
                 
                 # Compute new route avoiding the accident
                 old_route = list(self.route)
-                new_route = self.aco_reroute(graph, blocked_edge=accident_edge_actual)
+                new_route = self.aco_reroute(graph, blocked_node=accident_node)
 
                 # Only update route if different from current
                 if new_route != old_route:
@@ -69,81 +172,97 @@ class Vehicle:
                     except traci.exceptions.TraCIException as e:
                         print(f"[ERROR] Failed to set new route for {self.veh_id}: {e}")
 
-    def map_position_to_edge(self, position, graph):
-        x, y = position
-        min_dist = float('inf')
-        nearest_edge = None
-        for node, neighbors in graph.items():
-            node_pos = neighbors[0][0] if neighbors else node
-            dx = x - node_pos[0] if isinstance(node_pos, tuple) else 0
-            dy = y - node_pos[1] if isinstance(node_pos, tuple) else 0
-            d = math.hypot(dx, dy)
-            if d < min_dist:
-                min_dist = d
-                nearest_edge = node
-        return nearest_edge if nearest_edge else self.current_edge
-
-    def aco_reroute(self, graph, blocked_edge):
-        NUM_ANTS = 6
-        MAX_HOPS = 20
-        alpha = 1.0
-        beta = 2.0
-        evaporation = 0.1
-        pheromone = {edge: 1.0 for edge in graph}
+    def map_position_to_node(self, position, graph):
+        """Graph node nearest to position, or None if it is not in graph"""
+        _, i = GRAPH_NODE_TREE.query(position)
+        nearest_node = GRAPH_NODE_IDS[i]
+        return nearest_node if nearest_node in graph else None
+
+    def _ant_search(self, indptr, nbrs, costs, eta, start, dest, blocked):
+        """Best ant path from start to dest as node indices, or None"""
+        pheromone = self._pheromone
+        n_nodes = len(indptr) - 1
+        if len(pheromone) == n_nodes:
+            for i in range(n_nodes):
+                pheromone[i] = 1.0
+        else:
+            pheromone[:] = [1.0] * n_nodes
 
         best_route = None
         best_cost = float("inf")
-        destination = self.destination
 
-        for _ in range(NUM_ANTS):
-            current = self.current_edge
+        for _ in range(ACO_NUM_ANTS):
+            current = start
             visited = [current]
+            on_path = {current}
             cost = 0
 
-            for _ in range(MAX_HOPS):
-                neighbors = [(n, c) for n, c in graph.get(current, []) 
-                             if n != blocked_edge and n not in visited]
-                if not neighbors:
+            for _ in range(ACO_MAX_HOPS):
+                slots = [k for k in range(indptr[current], indptr[current + 1])
+                         if nbrs[k] != blocked and nbrs[k] not in on_path]
+                if not slots:
                     break
 
-                probs = []
-                for n, c in neighbors:
-                    tau = pheromone.get(n, 1.0) ** alpha
-                    eta = (1.0 / c) ** beta
-                    probs.append(tau * eta)
-                total = sum(probs)
-                probs = [p / total for p in probs]
-
-                r = random.random()
-                cumulative = 0
-                for idx, (n, _) in enumerate(neighbors):
-                    cumulative += probs[idx]
-                    if r <= cumulative:
-                        next_node = n
-                        next_cost = neighbors[idx][1]
-                        break
-
-                visited.append(next_node)
-                cost += next_cost
-                current = next_node
-                if current == destination:
+                # random.choices takes the weights unnormalized
+                weights = [pheromone[nbrs[k]] ** ACO_ALPHA * eta[k] for k in slots]
+                chosen = random.choices(slots, weights=weights)[0]
+
+                current = nbrs[chosen]
+                visited.append(current)
+                on_path.add(current)
+                cost += costs[chosen]
+                if current == dest:
                     break
 
-            if visited[-1] == destination and cost < best_cost:
+            if visited[-1] == dest and cost < best_cost:
                 best_cost = cost
                 best_route = visited
 
-            for node in visited:
-                pheromone[node] = (1 - evaporation) * pheromone.get(node, 1.0) + 0.1
+            for i in visited:
+                pheromone[i] = (1 - ACO_EVAPORATION) * pheromone[i] + 0.1
 
-        if not best_route:
-            best_route = [e for e in self.route if e != blocked_edge]
+        return best_route
 
-        # Ensure current edge is at the start of the route
-        if best_route[0] != self.current_edge:
-            best_route = [self.current_edge] + best_route
+    def aco_reroute(self, graph, blocked_node):
+        """Route from the current edge to the destination around blocked_node
 
-        # Remove blocked edge from route
-        best_route = [e for e in best_route if e != blocked_edge]
+        Graph nodes are junctions and SUMO edges are named "<from>_<to>", so
+        the search runs from the junction ahead of the vehicle to the one the
+        destination edge leaves, and the node path is turned back into edge
+        ids. The current route is kept when its remaining edges do not touch
+        blocked_node or when there is no way around it.
+        """
+        names, index, indptr, nbrs, costs, eta, paths = compile_graph(graph)
+        route = list(self.route)
+        blocked = index.get(blocked_node)
+        # On a junction the current (internal) edge is not part of the route,
+        # so there is no edge to start a replacement route from
+        if blocked is None or self.current_edge not in route or self.current_edge == self.destination:
+            return route
 
-        return best_route
+        remaining = route[route.index(self.current_edge):]
+        if not any(blocked_node in edge_nodes(e) for e in remaining[1:]):
+            return route
+
+        current_nodes = edge_nodes(self.current_edge)
+        dest_nodes = edge_nodes(self.destination)
+        if not current_nodes or not dest_nodes:
+            return route
+        start = index.get(current_nodes[1])
+        dest = index.get(dest_nodes[0])
+        if start is None or dest is None or blocked in (start, dest):
+            return route
+
+        if start == dest:
+            path = [start]
+        elif USE_ACO:
+            path = self._ant_search(indptr, nbrs, costs, eta, start, dest, blocked)
+        else:
+            path = paths[blocked][start].get(dest)
+        if not path:
+            return route
+
+        nodes = [names[i] for i in path]
+        new_route = [self.current_edge] + [f"{u}_{v}" for u, v in zip(nodes, nodes[1:])] + [self.destination]
+        # Same way ahead as before: keep the route (and its passed edges)
+        return route if new_route == remaining else new_route